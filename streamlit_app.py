@@ -1,6 +1,8 @@
 import streamlit as st
 import pandas as pd
 import os
+import hashlib
+import threading
 from datetime import date
 from openai import OpenAI
 
@@ -61,7 +63,12 @@ def read_facility_list():
 # ===============================
 st.set_page_config(page_title="ウェルサポイント", page_icon="💎", layout="wide")
 
-DATA_FILE = "points_data.csv"
+DATA_FILE = "points_data.csv"  # 当月分（ホット）
+ARCHIVE_DIR = "points_archive"  # 締めた月（YYYY-MM.csv と YYYY-MM_summary.csv）
+UNDATED_MONTH = "日付不明"  # 日付が読めない行の月ラベル
+ARCHIVE_CACHE_ENTRIES = 12  # メモリに置く過去月の明細（最大）
+SUMMARY_CACHE_ENTRIES = 240  # 月ごとの集計は小さいので20年分まで
+RECENT_LOOKBACK_MONTHS = 3  # コメント履歴をさかのぼる過去月数
 USER_FILE = "users.csv"
 ITEM_FILE = "items.csv"
 FACILITY_FILE = "facilities.csv"
@@ -87,13 +94,139 @@ def clean_name(s: str):
         .lower()
     )
 
+# 当月パーティションを読む（アーカイブ済みの月の行は除く・書き込みはしない）
 def load_data():
     if os.path.exists(DATA_FILE):
-        return pd.read_csv(DATA_FILE)
+        df = pd.read_csv(DATA_FILE)
+        return df[~_month_of(df["日付"]).isin(archived_months())].reset_index(drop=True)
     return pd.DataFrame(columns=["日付", "利用者名", "項目", "ポイント", "所属部署", "コメント"])
 
+def _write_csv(df, path):
+    # 一時ファイルに書いてから置き換える（読み手に途中のファイルを見せない）
+    tmp = f"{path}.tmp"
+    df.to_csv(tmp, index=False, encoding="utf-8-sig")
+    os.replace(tmp, path)
+
 def save_data(df):
-    df.to_csv(DATA_FILE, index=False, encoding="utf-8-sig")
+    _write_csv(df, DATA_FILE)
+
+# ===============================
+# 月別パーティション（当月はホット、過去月はアーカイブ）
+# ===============================
+def _month_of(dates):
+    return pd.to_datetime(dates, errors="coerce").dt.to_period("M").astype(str)
+
+def _current_month():
+    return date.today().strftime("%Y-%m")
+
+def _archive_path(month, summary=False):
+    return os.path.join(ARCHIVE_DIR, f"{month}_summary.csv" if summary else f"{month}.csv")
+
+# 当月ファイルの書き換え（付与・月締め）を直列化するロック（プロセスで1つ）
+@st.cache_resource
+def _ledger_lock():
+    return threading.Lock()
+
+# 締めた月の行をアーカイブへ書き出し、当月分だけを返す（_ledger_lock() 内で呼ぶ）
+# アーカイブは一度だけ書き、既にある月は書き直さない。集計を先に書き、明細ファイルの存在をその月の確定とする
+def roll_over_months(df):
+    months = _month_of(df["日付"])
+    closed = months.ne("NaT") & (months < _current_month())
+    if not closed.any():
+        return df
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    for month, df_m in df[closed].groupby(months[closed]):
+        path = _archive_path(month)
+        if os.path.exists(path):
+            continue
+        df_sum = df_m.groupby("利用者名").agg(
+            ポイント=("ポイント", "sum"), 最新コメント=("コメント", "last")
+        ).reset_index()
+        _write_csv(df_sum, _archive_path(month, summary=True))
+        _write_csv(df_m, path)
+    return df[~closed].reset_index(drop=True)
+
+# アーカイブ済みの月（新しい順）
+def archived_months():
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    return sorted(
+        (f[:-4] for f in os.listdir(ARCHIVE_DIR) if f.endswith(".csv") and not f.endswith("_summary.csv")),
+        reverse=True
+    )
+
+@st.cache_data(show_spinner=False, max_entries=ARCHIVE_CACHE_ENTRIES)
+def _read_archive(path, mtime):
+    return pd.read_csv(path)
+
+@st.cache_data(show_spinner=False, max_entries=SUMMARY_CACHE_ENTRIES)
+def _read_summary(path, mtime):
+    return pd.read_csv(path)
+
+def load_month_summary(month):
+    path = _archive_path(month, summary=True)
+    if os.path.exists(path):
+        return _read_summary(path, os.path.getmtime(path))
+    return None
+
+# 当月分＋アーカイブの月一覧（新しい順、日付不明の行があれば末尾に UNDATED_MONTH）
+def list_months(df):
+    hot_months = _month_of(df["日付"])
+    hot = [m for m in hot_months.unique() if m != "NaT"]
+    months = sorted(set(hot) | set(archived_months()), reverse=True)
+    if hot_months.eq("NaT").any():
+        months.append(UNDATED_MONTH)
+    return months
+
+# 指定月の行（過去月は選ばれたときだけアーカイブから読む。cache=False ならキャッシュに載せない）
+def load_month(month, df, cache=True):
+    if month == UNDATED_MONTH:
+        return df[_month_of(df["日付"]) == "NaT"]
+    path = _archive_path(month)
+    if os.path.exists(path):
+        return _read_archive(path, os.path.getmtime(path)) if cache else pd.read_csv(path)
+    return df[_month_of(df["日付"]) == month]
+
+# 全期間の行（古い順）。一度きりの表示なのでディスクから直接読む
+def load_all(df):
+    parts = [load_month(m, df, cache=False) for m in reversed(archived_months())]
+    return pd.concat(parts + [df], ignore_index=True)
+
+# 月×利用者のポイント合計（過去月は事前集計、当月はその場で集計）
+def load_summary(df):
+    parts = []
+    for m in archived_months():
+        df_sum = load_month_summary(m)
+        if df_sum is not None:
+            parts.append(df_sum.assign(年月=m))
+    df_hot = df.assign(年月=_month_of(df["日付"]).replace("NaT", UNDATED_MONTH)).groupby(["年月", "利用者名"])["ポイント"].sum().reset_index()
+    return pd.concat(parts + [df_hot], ignore_index=True)[["年月", "利用者名", "ポイント"]]
+
+# 新しい月から順に match に合う行を n 件まで集める（さかのぼるのは RECENT_LOOKBACK_MONTHS か月まで）
+def recent_rows(df, match, n):
+    parts = [df[match(df)]]
+    count = len(parts[0])
+    for m in archived_months()[:RECENT_LOOKBACK_MONTHS]:
+        if count >= n:
+            break
+        df_m = load_month(m, df)
+        parts.insert(0, df_m[match(df_m)])
+        count += len(parts[0])
+    return pd.concat(parts, ignore_index=True).tail(n)
+
+# 最新のコメント1件（当月になければ各月の集計の「最新コメント」をさかのぼる。明細は開かない）
+def latest_comment(df, match, comment_col):
+    hit = df[match(df) & df[comment_col].notna()]
+    if not hit.empty:
+        return hit[comment_col].iloc[-1]
+    for m in archived_months():
+        df_sum = load_month_summary(m)
+        if df_sum is None or "最新コメント" not in df_sum.columns:
+            continue
+        hit = df_sum[match(df_sum) & df_sum["最新コメント"].notna()]
+        if not hit.empty:
+            return hit["最新コメント"].iloc[-1]
+    return None
 
 def read_user_list():
     if os.path.exists(USER_FILE):
@@ -118,17 +251,68 @@ def show_df(df_or_styler):
 def edit_df(df):
     return st.data_editor(df, use_container_width=True, hide_index=True)
 
+# ===============================
+# ランキング表の描画キャッシュ
+# ===============================
+HL_CLASS = "hl-on"
+RANK_HTML_CACHE_ENTRIES = 64  # 表4種 × 数か月分。古いバージョンのHTMLは押し出される
+
+def _file_version(path):
+    if not os.path.exists(path):
+        return (0, 0)
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _archive_version():
+    # アーカイブ（ディレクトリと各ファイル）の最新の更新時刻・合計サイズ・ファイル数
+    if not os.path.isdir(ARCHIVE_DIR):
+        return (0, 0, 0)
+    versions = [_file_version(os.path.join(ARCHIVE_DIR, f)) for f in os.listdir(ARCHIVE_DIR)]
+    newest = max([os.stat(ARCHIVE_DIR).st_mtime_ns] + [v[0] for v in versions])
+    return (newest, sum(v[1] for v in versions), len(versions))
+
+def _data_version(tbl):
+    # ファイルの更新時刻(ns)・サイズに加え、表そのもののハッシュもバージョンに含める
+    # （同じ時刻内の書き換えでも古いHTMLを返さない）
+    files = tuple(_file_version(f) for f in (DATA_FILE, USER_FILE))
+    return files + (_archive_version(), int(pd.util.hash_pandas_object(tbl).sum()))
+
+def _hl_class(value):
+    return "hl-" + hashlib.md5(str(value).encode("utf-8")).hexdigest()[:12]
+
+@st.cache_data(show_spinner=False, max_entries=RANK_HTML_CACHE_ENTRIES)
+def render_rank_html(kind, month, data_version, _tbl, key_col):
+    # ハイライト前のランキング表HTMLを作る（行ごとに key_col の値のクラスを付与）
+    classes = pd.DataFrame(
+        [[_hl_class(v)] * len(_tbl.columns) for v in _tbl[key_col]],
+        index=_tbl.index, columns=_tbl.columns
+    )
+    styler = _tbl.style.set_td_classes(classes).set_table_styles(
+        [{"selector": f"td.{HL_CLASS}", "props": [("background-color", "#d2e3fc")]}]
+    )
+    try:
+        styler = styler.hide(axis="index")
+    except Exception:
+        try:
+            styler = styler.hide_index()
+        except Exception:
+            pass
+    return styler.to_html()
+
 
 # ===============================
 # AIコメント生成（本人＋項目限定）
 # ===============================
-def generate_comment(user_name, item, points):
+def generate_comment(user_name, item, points, df):
     try:
-        if os.path.exists(DATA_FILE):
-            df_hist = pd.read_csv(DATA_FILE)
-            df_hist = df_hist[(df_hist["利用者名"] == user_name) & (df_hist["項目"] == item)]
+        if not df.empty or archived_months():
+            df_hist = recent_rows(
+                df,
+                lambda d: (d["利用者名"] == user_name) & (d["項目"] == item) & d["コメント"].notna(),
+                5
+            )
             if not df_hist.empty:
-                recent_comments = " / ".join(df_hist["コメント"].dropna().tail(5).tolist())
+                recent_comments = " / ".join(df_hist["コメント"].tolist())
                 history_summary = f"{user_name}さんの過去の『{item}』コメント例: {recent_comments}"
             else:
                 history_summary = f"{user_name}さんの『{item}』にはまだコメント履歴がありません。"
@@ -258,7 +442,7 @@ if mode == "職員モード":
 
                 if st.button("ポイントを付与"):
                     if user_name and selected_item:
-                        comment = generate_comment(user_name, selected_item, points_value)
+                        comment = generate_comment(user_name, selected_item, points_value, df)
                         new_record = {
                             "日付": date.today().strftime("%Y-%m-%d"),
                             "利用者名": user_name,
@@ -267,8 +451,11 @@ if mode == "職員モード":
                             "所属部署": dept,
                             "コメント": comment
                         }
-                        df = pd.concat([df, pd.DataFrame([new_record])], ignore_index=True)
-                        save_data(df)
+                        # 最新の当月ファイルを読み直し、月締めと追記をまとめて行う
+                        with _ledger_lock():
+                            df = roll_over_months(load_data())
+                            df = pd.concat([df, pd.DataFrame([new_record])], ignore_index=True)
+                            save_data(df)
                         st.success(f"{user_name} に {points_value} pt を付与しました！")
                         st.info(f"AIコメント: {comment}")
 
@@ -277,13 +464,16 @@ if mode == "職員モード":
         # =========================================================
         elif staff_tab == "履歴閲覧":
             st.subheader("📜 ポイント履歴の閲覧")
-            if df.empty:
+            month_list = list_months(df)
+            if not month_list:
                 st.info("まだ履歴データがありません。")
             else:
                 df_user = read_user_list()
                 user_options = ["すべて"] + df_user["氏名"].dropna().unique().tolist()
                 selected_user = st.selectbox("利用者を選択（またはすべて）", user_options)
-                df_view = df.copy() if selected_user == "すべて" else df[df["利用者名"] == selected_user]
+                selected_month = st.selectbox("表示する月を選択（またはすべて）", month_list + ["すべて"], index=0)
+                df_hist = load_all(df) if selected_month == "すべて" else load_month(selected_month, df)
+                df_view = df_hist.copy() if selected_user == "すべて" else df_hist[df_hist["利用者名"] == selected_user]
                 if not df_view.empty:
                     df_view = df_view.sort_values("日付", ascending=False).reset_index(drop=True)
                     df_view.rename(columns={"コメント": "AIコメント"}, inplace=True)
@@ -296,79 +486,77 @@ if mode == "職員モード":
         # =========================================================
         elif staff_tab == "月次ランキング":
             st.subheader("🏆 月次ランキング（月・施設別）")
-            if df.empty:
+            month_list = list_months(df)
+            if not month_list:
                 st.info("まだポイントデータがありません。")
             else:
                 df_all_users = read_user_list()
-                df_rank = df.copy()
-                df_rank["年月"] = pd.to_datetime(df_rank["日付"], errors="coerce").dt.to_period("M").astype(str)
-                month_list = sorted(df_rank["年月"].dropna().unique(), reverse=True)
-                if month_list:
-                    selected_month = st.selectbox("表示する月を選択", month_list, index=0)
-                    df_month = df_rank[df_rank["年月"] == selected_month]
-                    merged = pd.merge(df_month, df_all_users[["氏名", "施設"]],
-                                      left_on="利用者名", right_on="氏名", how="left")
+                selected_month = st.selectbox("表示する月を選択", month_list, index=0)
+                df_month = load_month(selected_month, df)
+                merged = pd.merge(df_month, df_all_users[["氏名", "施設"]],
+                                  left_on="利用者名", right_on="氏名", how="left")
 
-                    facility_list = ["すべて"] + sorted(merged["施設"].dropna().unique().tolist())
-                    selected_facility = st.selectbox("施設を選択（またはすべて）", facility_list)
-                    if selected_facility != "すべて":
-                        merged = merged[merged["施設"] == selected_facility]
-
-                    # =========================================================
-                    # 施設別ランキング：合計ポイント＆1人あたりポイント
-                    # =========================================================
-
-                    # --- 合計ポイント ---
-                    df_home_total = merged.groupby("施設", dropna=False)["ポイント"].sum().reset_index().fillna({"施設": "（未登録）"})
-                    df_home_total = df_home_total.sort_values("ポイント", ascending=False).reset_index(drop=True)
-                    df_home_total["順位"] = range(1, len(df_home_total) + 1)
-                    df_home_total["順位表示"] = df_home_total["順位"].apply(
-                        lambda x: "🥇" if x == 1 else "🥈" if x == 2 else "🥉" if x == 3 else str(x)
-                    )
-
-                    st.markdown("### 🏠 施設別ランキング（合計ポイント）")
-                    show_table(df_home_total[["順位表示", "施設", "ポイント"]])
-
-                    # --- 1人あたり平均ポイント ---
-                    df_fac_users = df_all_users.groupby("施設")["氏名"].nunique().reset_index()
-                    df_fac_users.rename(columns={"氏名": "利用者数"}, inplace=True)
-
-                    df_home_avg = pd.merge(df_home_total, df_fac_users, on="施設", how="left")
-                    df_home_avg["利用者数"] = df_home_avg["利用者数"].fillna(0).astype(int)
-                    df_home_avg["1人あたりポイント"] = df_home_avg.apply(
-                        lambda x: 0 if x["利用者数"] == 0 else round(x["ポイント"] / x["利用者数"], 1),
-                        axis=1
-                    )
-
-                    df_home_avg = df_home_avg.sort_values("1人あたりポイント", ascending=False).reset_index(drop=True)
-                    df_home_avg["順位"] = range(1, len(df_home_avg) + 1)
-                    df_home_avg["順位表示"] = df_home_avg["順位"].apply(
-                        lambda x: "🥇" if x == 1 else "🥈" if x == 2 else "🥉" if x == 3 else str(x)
-                    )
-
-                    st.markdown("### 🧮 施設別ランキング（1人あたり平均ポイント）")
-                    show_table(df_home_avg[["順位表示", "施設", "1人あたりポイント"]])
-
-
-                    # 利用者別集計
-                    df_user_rank = merged.groupby(["利用者名", "施設"], dropna=False)["ポイント"].sum().reset_index()
-                    df_user_rank = df_user_rank.sort_values("ポイント", ascending=False).head(10).reset_index(drop=True)
-                    df_user_rank["順位"] = range(1, len(df_user_rank) + 1)
-                    df_user_rank["順位表示"] = df_user_rank["順位"].apply(
-                        lambda x: "🥇" if x == 1 else "🥈" if x == 2 else "🥉" if x == 3 else str(x))
-                    st.markdown("### 👥 利用者別ランキング（上位10名）")
-                    show_table(df_user_rank[["順位表示", "利用者名", "施設", "ポイント"]])
+                facility_list = ["すべて"] + sorted(merged["施設"].dropna().unique().tolist())
+                selected_facility = st.selectbox("施設を選択（またはすべて）", facility_list)
+                if selected_facility != "すべて":
+                    merged = merged[merged["施設"] == selected_facility]
+
+                # =========================================================
+                # 施設別ランキング：合計ポイント＆1人あたりポイント
+                # =========================================================
+
+                # --- 合計ポイント ---
+                df_home_total = merged.groupby("施設", dropna=False)["ポイント"].sum().reset_index().fillna({"施設": "（未登録）"})
+                df_home_total = df_home_total.sort_values("ポイント", ascending=False).reset_index(drop=True)
+                df_home_total["順位"] = range(1, len(df_home_total) + 1)
+                df_home_total["順位表示"] = df_home_total["順位"].apply(
+                    lambda x: "🥇" if x == 1 else "🥈" if x == 2 else "🥉" if x == 3 else str(x)
+                )
+
+                st.markdown("### 🏠 施設別ランキング（合計ポイント）")
+                show_table(df_home_total[["順位表示", "施設", "ポイント"]])
+
+                # --- 1人あたり平均ポイント ---
+                df_fac_users = df_all_users.groupby("施設")["氏名"].nunique().reset_index()
+                df_fac_users.rename(columns={"氏名": "利用者数"}, inplace=True)
+
+                df_home_avg = pd.merge(df_home_total, df_fac_users, on="施設", how="left")
+                df_home_avg["利用者数"] = df_home_avg["利用者数"].fillna(0).astype(int)
+                df_home_avg["1人あたりポイント"] = df_home_avg.apply(
+                    lambda x: 0 if x["利用者数"] == 0 else round(x["ポイント"] / x["利用者数"], 1),
+                    axis=1
+                )
+
+                df_home_avg = df_home_avg.sort_values("1人あたりポイント", ascending=False).reset_index(drop=True)
+                df_home_avg["順位"] = range(1, len(df_home_avg) + 1)
+                df_home_avg["順位表示"] = df_home_avg["順位"].apply(
+                    lambda x: "🥇" if x == 1 else "🥈" if x == 2 else "🥉" if x == 3 else str(x)
+                )
+
+                st.markdown("### 🧮 施設別ランキング（1人あたり平均ポイント）")
+                show_table(df_home_avg[["順位表示", "施設", "1人あたりポイント"]])
+
+
+                # 利用者別集計
+                df_user_rank = merged.groupby(["利用者名", "施設"], dropna=False)["ポイント"].sum().reset_index()
+                df_user_rank = df_user_rank.sort_values("ポイント", ascending=False).head(10).reset_index(drop=True)
+                df_user_rank["順位"] = range(1, len(df_user_rank) + 1)
+                df_user_rank["順位表示"] = df_user_rank["順位"].apply(
+                    lambda x: "🥇" if x == 1 else "🥈" if x == 2 else "🥉" if x == 3 else str(x))
+                st.markdown("### 👥 利用者別ランキング（上位10名）")
+                show_table(df_user_rank[["順位表示", "利用者名", "施設", "ポイント"]])
 
         # =========================================================
         # 累計利用者ランキング
         # =========================================================
         elif staff_tab == "累計利用者ランキング":
             st.subheader("👑 累計利用者ランキング")
-            if df.empty:
+            df_sum = load_summary(df)
+            if df_sum.empty:
                 st.info("データがありません。")
             else:
                 df_all_users = read_user_list()
-                total_rank = pd.merge(df, df_all_users[["氏名", "施設"]],
+                total_rank = pd.merge(df_sum, df_all_users[["氏名", "施設"]],
                                       left_on="利用者名", right_on="氏名", how="left")
                 total_rank = total_rank.groupby(["利用者名", "施設"])["ポイント"].sum().reset_index()
                 total_rank = total_rank.sort_values("ポイント", ascending=False).head(10).reset_index(drop=True)
@@ -491,19 +679,8 @@ elif mode == "利用者モード":
     def show_table(tbl):
         import pandas as pd
 
-        # --- Styler（ハイライト付き） ---
-        if isinstance(tbl, pd.io.formats.style.Styler):
-            try:
-                tbl = tbl.hide(axis="index")
-            except Exception:
-                try:
-                    tbl = tbl.hide_index()
-                except Exception:
-                    pass
-            st.markdown(tbl.to_html(), unsafe_allow_html=True)
-
         # --- DataFrame（履歴・推移など） ---
-        elif isinstance(tbl, pd.DataFrame):
+        if isinstance(tbl, pd.DataFrame):
             html = tbl.reset_index(drop=True).to_html(index=False, escape=False)
             st.markdown(f"<div style='overflow-x:auto'>{html}</div>", unsafe_allow_html=True)
 
@@ -511,6 +688,13 @@ elif mode == "利用者モード":
         else:
             st.write(tbl)
 
+    # --- ランキング表（キャッシュ済みHTML＋本人/自施設のクラス差し替え） ---
+    def show_rank_table(tbl, kind, month, key_col, hl_value):
+        html = render_rank_html(kind, month, _data_version(tbl), tbl, key_col)
+        if hl_value:
+            html = html.replace(_hl_class(hl_value), HL_CLASS)
+        st.markdown(html, unsafe_allow_html=True)
+
     # =========================================================
     # ログイン処理
     # =========================================================
@@ -545,30 +729,31 @@ elif mode == "利用者モード":
         user_name = st.session_state["user_name"]
         st.sidebar.success(f"✅ ログイン中：{user_name}")
         df_all_users = read_user_list()
-        df_local = df.copy()
-        df_local["__clean"] = df_local["利用者名"].apply(clean_name)
-        df_user_points = df_local[df_local["__clean"] == clean_name(user_name)].drop(columns="__clean", errors="ignore")
+
+        def is_me(d):
+            return d["利用者名"].apply(clean_name) == clean_name(user_name)
 
         # 💬 最近のありがとう
-        if not df_user_points.empty:
-            comment_col = "コメント" if "コメント" in df_user_points.columns else (
-                "AIからのメッセージ" if "AIからのメッセージ" in df_user_points.columns else None
-            )
-            if comment_col:
-                recent_comment = df_user_points[comment_col].dropna()
-                if not recent_comment.empty:
-                    last_comment = recent_comment.iloc[-1]
-                    st.markdown(
-                        f"<div style='background:#e6f2ff;padding:10px;border-radius:8px;'>"
-                        f"<h4>💬 最近のありがとう</h4><p>{last_comment}</p></div>",
-                        unsafe_allow_html=True
-                    )
-                    st.markdown("<div style='margin-bottom: 30px;'></div>", unsafe_allow_html=True)
+        comment_col = "コメント" if "コメント" in df.columns else (
+            "AIからのメッセージ" if "AIからのメッセージ" in df.columns else None
+        )
+        if comment_col:
+            last_comment = latest_comment(df, is_me, comment_col)
+            if last_comment is not None:
+                st.markdown(
+                    f"<div style='background:#e6f2ff;padding:10px;border-radius:8px;'>"
+                    f"<h4>💬 最近のありがとう</h4><p>{last_comment}</p></div>",
+                    unsafe_allow_html=True
+                )
+                st.markdown("<div style='margin-bottom: 30px;'></div>", unsafe_allow_html=True)
 
         # 💎 あなたのありがとう履歴
         st.subheader("💎 ウェルサポイント履歴")
+        show_all = st.checkbox("過去の履歴もすべて表示")
+        df_hist = load_all(df) if show_all else df
+        df_user_points = df_hist[is_me(df_hist)]
         if df_user_points.empty:
-            st.info("まだポイント履歴がありません。")
+            st.info("まだポイント履歴がありません。" if show_all else "今月のポイント履歴はまだありません。")
         else:
             df_view = df_user_points[["日付", "項目", "ポイント", "コメント"]].copy()
             df_view.rename(columns={"コメント": "メッセージ"}, inplace=True)
@@ -576,10 +761,11 @@ elif mode == "利用者モード":
 
         # 🌱 月ごとのがんばり
         st.subheader("🌱 ウェルサポイント推移")
-        if not df_user_points.empty:
+        df_sum = load_summary(df)
+        df_sum_user = df_sum[is_me(df_sum)]
+        if not df_sum_user.empty:
             monthly_points = (
-                df_user_points.assign(年月=pd.to_datetime(df_user_points["日付"], errors="coerce").dt.to_period("M").astype(str))
-                .groupby("年月")["ポイント"].sum()
+                df_sum_user.groupby("年月")["ポイント"].sum()
                 .reset_index()
                 .sort_values("年月")
             )
@@ -592,14 +778,12 @@ elif mode == "利用者モード":
 
         # 🏠 グルホランキング（月ごと）
         st.subheader("🏠 グルホランキング（月ごと）")
-        if os.path.exists(USER_FILE) and not df.empty:
+        month_list = list_months(df)
+        if os.path.exists(USER_FILE):
             df_all_users = read_user_list()
-            df_rank = df.copy()
-            df_rank["年月"] = pd.to_datetime(df_rank["日付"], errors="coerce").dt.to_period("M").astype(str)
-            month_list = sorted(df_rank["年月"].dropna().unique(), reverse=True)
             if month_list:
                 selected_month = st.selectbox("表示する月を選択", month_list, index=0)
-                df_month = df_rank[df_rank["年月"] == selected_month]
+                df_month = load_month(selected_month, df)
                 merged = pd.merge(df_month, df_all_users[["氏名", "施設"]],
                                   left_on="利用者名", right_on="氏名", how="left")
 
@@ -615,13 +799,9 @@ elif mode == "利用者モード":
                     lambda x: "🥇" if x == 1 else "🥈" if x == 2 else "🥉" if x == 3 else str(x)
                 )
 
-                def hl_fac_total(row):
-                    if user_fac and row["施設"] == user_fac:
-                        return ['background-color: #d2e3fc'] * len(row)
-                    return [''] * len(row)
-
                 st.markdown("### 🏆 合計ウェルサポイント")
-                show_table(df_home_total[["順位表示", "施設", "ポイント"]].style.apply(hl_fac_total, axis=1))
+                show_rank_table(df_home_total[["順位表示", "施設", "ポイント"]],
+                                "fac_total", selected_month, "施設", user_fac)
 
                 # --- 1人あたり平均ポイント ---
                 df_fac_users = df_all_users.groupby("施設")["氏名"].nunique().reset_index()
@@ -638,45 +818,33 @@ elif mode == "利用者モード":
                     lambda x: "🥇" if x == 1 else "🥈" if x == 2 else "🥉" if x == 3 else str(x)
                 )
 
-                def hl_fac_avg(row):
-                    if user_fac and row["施設"] == user_fac:
-                        return ['background-color: #d2e3fc'] * len(row)
-                    return [''] * len(row)
-
                 st.markdown("### 🧮 1人あたりウェルサポイント")
-                show_table(df_home_avg[["順位表示", "施設", "1人あたりポイント"]].style.apply(hl_fac_avg, axis=1))
+                show_rank_table(df_home_avg[["順位表示", "施設", "1人あたりポイント"]],
+                                "fac_avg", selected_month, "施設", user_fac)
             else:
                 st.info("月別データがありません。")
 
         # 👥 月別利用者ランキング
         st.subheader("🏅 月別利用者ランキング")
-        if not df.empty:
-            df_rank_user = df.copy()
-            df_rank_user["年月"] = pd.to_datetime(df_rank_user["日付"], errors="coerce").dt.to_period("M").astype(str)
-            month_list_user = sorted(df_rank_user["年月"].dropna().unique(), reverse=True)
-            if month_list_user:
-                selected_month_user = st.selectbox("ランキング月を選択", month_list_user, index=0)
-                df_month_user = df_rank_user[df_rank_user["年月"] == selected_month_user]
-                merged_user = pd.merge(df_month_user, df_all_users[["氏名", "施設"]],
-                                       left_on="利用者名", right_on="氏名", how="left")
-                df_user_rank = merged_user.groupby(["利用者名", "施設"], dropna=False)["ポイント"].sum().reset_index()
-                df_user_rank = df_user_rank.sort_values("ポイント", ascending=False).head(10).reset_index(drop=True)
-                df_user_rank["順位"] = range(1, len(df_user_rank) + 1)
-                df_user_rank["順位表示"] = df_user_rank["順位"].apply(
-                    lambda x: "🥇" if x == 1 else "🥈" if x == 2 else "🥉" if x == 3 else str(x)
-                )
-
-                def hl_user(row):
-                    if row["利用者名"] == user_name:
-                        return ['background-color: #d2e3fc'] * len(row)
-                    return [''] * len(row)
+        if month_list:
+            selected_month_user = st.selectbox("ランキング月を選択", month_list, index=0)
+            df_month_user = load_month(selected_month_user, df)
+            merged_user = pd.merge(df_month_user, df_all_users[["氏名", "施設"]],
+                                   left_on="利用者名", right_on="氏名", how="left")
+            df_user_rank = merged_user.groupby(["利用者名", "施設"], dropna=False)["ポイント"].sum().reset_index()
+            df_user_rank = df_user_rank.sort_values("ポイント", ascending=False).head(10).reset_index(drop=True)
+            df_user_rank["順位"] = range(1, len(df_user_rank) + 1)
+            df_user_rank["順位表示"] = df_user_rank["順位"].apply(
+                lambda x: "🥇" if x == 1 else "🥈" if x == 2 else "🥉" if x == 3 else str(x)
+            )
 
-                show_table(df_user_rank[["順位表示", "利用者名", "施設", "ポイント"]].style.apply(hl_user, axis=1))
+            show_rank_table(df_user_rank[["順位表示", "利用者名", "施設", "ポイント"]],
+                            "user_month", selected_month_user, "利用者名", user_name)
 
         # 👑 累計利用者ランキング
         st.subheader("👑 累計利用者ランキング")
-        if not df.empty:
-            merged_total = pd.merge(df, df_all_users[["氏名", "施設"]],
+        if not df_sum.empty:
+            merged_total = pd.merge(df_sum, df_all_users[["氏名", "施設"]],
                                     left_on="利用者名", right_on="氏名", how="left")
             df_total = merged_total.groupby(["利用者名", "施設"])["ポイント"].sum().reset_index()
             df_total = df_total.sort_values("ポイント", ascending=False).head(10).reset_index(drop=True)
@@ -685,12 +853,8 @@ elif mode == "利用者モード":
                 lambda x: "🥇" if x == 1 else "🥈" if x == 2 else "🥉" if x == 3 else str(x)
             )
 
-            def hl_total(row):
-                if row["利用者名"] == user_name:
-                    return ['background-color: #d2e3fc'] * len(row)
-                return [''] * len(row)
-
-            show_table(df_total[["順位表示", "利用者名", "施設", "ポイント"]].style.apply(hl_total, axis=1))
+            show_rank_table(df_total[["順位表示", "利用者名", "施設", "ポイント"]],
+                            "user_total", None, "利用者名", user_name)
 
         # 🚪 ログアウト
         st.sidebar.button("🚪 ログアウト", on_click=lambda: (st.session_state.clear(), st.rerun()))